@@ -4,39 +4,75 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
-import time
 import os
 import io
+import base64
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from streamlit_autorefresh import st_autorefresh
 
 # Static shared encryption key
 ENCRYPTION_KEY = b'27VNJatctBfMT4CEYRmiB5F_IzRa0akQ0cDHSBIRtz4='
 fernet = Fernet(ENCRYPTION_KEY)
-
-# 🔍 Locate OneDrive > Benchmarks folder
+# The Fernet key's bytes are its own HMAC + AES-CBC keys, so derive a separate key for GCM
+GCM_KEY = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+               info=b"evtol-violations-aes-gcm").derive(base64.urlsafe_b64decode(ENCRYPTION_KEY))
+aesgcm = AESGCM(GCM_KEY)
+NONCE_SIZE = 12
+FERNET_PREFIX = b"gAAAAA"  # base64 of Fernet's 0x80 version byte + timestamp
+
+def decrypt_bytes(data):
+    # Files are nonce || AES-GCM ciphertext; older files are still Fernet tokens
+    if data.startswith(FERNET_PREFIX):
+        return fernet.decrypt(data)
+    return aesgcm.decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], None)
+
+# 🔍 Locate OneDrive > Benchmarks folder (cached server-wide; a miss is cleared below so it is retried)
+@st.cache_resource(show_spinner=False)
 def find_benchmarks_folder():
     base_path = os.path.join(os.environ.get("USERPROFILE", "C:\\Users\\Default"))
     for i in os.listdir(base_path):
         if i.startswith("OneDrive "):
             base_path = os.path.join(base_path, i)
             break
-    for root, dirs, _ in os.walk(base_path):
-        for d in dirs:
-            if d.lower().endswith("benchmarks"):
-                return os.path.join(root, d)
+    # Only look two levels deep instead of walking the whole synced tree
+    with os.scandir(base_path) as entries:
+        subdirs = [e for e in entries if e.is_dir()]
+    for entry in subdirs:
+        if entry.name.lower().endswith("benchmarks"):
+            return entry.path
+    for entry in subdirs:
+        try:
+            with os.scandir(entry.path) as children:
+                for child in children:
+                    if child.is_dir() and child.name.lower().endswith("benchmarks"):
+                        return child.path
+        except OSError:
+            continue
     return None
 
-# 🔐 Load and decrypt CSV
-def load_encrypted_csv(path):
+# 🔐 Load and decrypt CSV (re-runs only when the file's mtime changes)
+@st.cache_data(ttl=10, show_spinner=False)
+def load_encrypted_csv(path, mtime):
     try:
         with open(path, 'rb') as f:
             encrypted_data = f.read()
-        decrypted = fernet.decrypt(encrypted_data).decode()
-        return pd.read_csv(io.StringIO(decrypted))
+        decrypted = decrypt_bytes(encrypted_data)
+        return pd.read_csv(io.BytesIO(decrypted), engine="pyarrow")
     except Exception as e:
         st.error(f"❌ Failed to decrypt/load CSV: {e}")
         st.stop()
 
+def file_mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+# 📥 CSV payload for download buttons (only re-encoded when the data changes)
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+def df_to_csv_bytes(df):
+    return df.to_csv(index=False).encode("utf-8")
+
 # 🌐 Streamlit setup
 st.set_page_config(page_title="🏆 Benchmark Dashboard", layout="wide")
 st.title("🏆 Team Benchmark Dashboard")
@@ -44,13 +80,15 @@ st.title("🏆 Team Benchmark Dashboard")
 # 📁 OneDrive root
 ONEDRIVE_FOLDER = find_benchmarks_folder()
 if not ONEDRIVE_FOLDER:
+    find_benchmarks_folder.clear()  # folder may still be syncing; look again on the next run
     st.error("❌ OneDrive Benchmarks folder not found.")
     st.stop()
 
 # 📊 Load Benchmarks
 CSV_PATH = os.path.join(ONEDRIVE_FOLDER, "master_results.csv")
-df = load_encrypted_csv(CSV_PATH)
+df = load_encrypted_csv(CSV_PATH, file_mtime(CSV_PATH))
 df.columns = [col.strip() for col in df.columns]
+df["Team"] = df["Team"].astype("category")
 df["Last Run"] = pd.to_datetime(df["Last Run"])
 
 # 🎛️ Filters
@@ -73,7 +111,7 @@ col3.metric("🥇 Best Score (Lowest)", f"{df_filtered['Best Score'].min():.2f}"
 # 📥 Download Benchmarks
 st.download_button(
     label="📥 Download Filtered CSV",
-    data=df_filtered.to_csv(index=False).encode("utf-8"),
+    data=df_to_csv_bytes(df_filtered),
     file_name="filtered_benchmark_results.csv",
     mime="text/csv",
 )
@@ -85,8 +123,8 @@ tab1, tab2, tab3, tab4 = st.tabs([
 
 df_sorted = df_filtered.sort_values("Current Score")
 df_time = df_filtered.sort_values("Last Run", ascending=False)
-df_best = df_filtered.loc[df_filtered.groupby("Team")["Best Score"].idxmin()]
-df_best_sorted = df_best.sort_values("Best Score")  # ✅ Sorted by Best Score
+# ✅ Each team's lowest Best Score, sorted by Best Score (single sort + dedup)
+df_best_sorted = df_filtered.sort_values("Best Score", kind="stable").drop_duplicates("Team", keep="first")
 
 with tab1:
     st.subheader("📈 Current Scores (Sorted)")
@@ -94,9 +132,12 @@ with tab1:
 
 with tab2:
     st.subheader("📊 Team Score Chart")
+    # Per-bar text labels bloat the figure JSON, so only show them for small charts
     fig = px.bar(df_sorted, x="Team", y="Current Score", color="Current Score",
-                 color_continuous_scale="Blues_r", text="Current Score")
-    st.plotly_chart(fig)
+                 color_continuous_scale="Blues_r",
+                 text="Current Score" if len(df_sorted) <= 30 else None)
+    fig.update_layout(uirevision="bench")
+    st.plotly_chart(fig, use_container_width=True, theme=None)
     
     st.subheader("🥇 Best Scores by Team (Sorted)")
     st.dataframe(df_best_sorted[["Team", "Best Score"]])
@@ -112,7 +153,7 @@ with tab4:
 
     violation_dir = os.path.join(ONEDRIVE_FOLDER, "violation_detection")
     master_violation_path = os.path.join(violation_dir, "master_violation.csv")
-    violation_df = load_encrypted_csv(master_violation_path)
+    violation_df = load_encrypted_csv(master_violation_path, file_mtime(master_violation_path))
     violation_df.columns = [col.strip().lower() for col in violation_df.columns]
 
     # 🔢 Convert columns to numeric (safe conversion)
@@ -121,17 +162,13 @@ with tab4:
         "current_collision", "lowest_collision",
         "current_redlight", "lowest_redlight"
     ]
-    for col in cols_to_convert:
-        if col in violation_df.columns:
-            violation_df[col] = pd.to_numeric(violation_df[col], errors="coerce")
+    present = [col for col in cols_to_convert if col in violation_df.columns]
+    violation_df[present] = violation_df[present].apply(pd.to_numeric, errors="coerce")
 
     # ✅ Sort by total lowest violations (optional helper column)
-    if all(col in violation_df.columns for col in ["lowest_lane", "lowest_collision", "lowest_redlight"]):
-        violation_df["total_lowest_violations"] = (
-            violation_df["lowest_lane"] +
-            violation_df["lowest_collision"] +
-            violation_df["lowest_redlight"]
-        )
+    low_cols = ["lowest_lane", "lowest_collision", "lowest_redlight"]
+    if set(low_cols).issubset(violation_df.columns):
+        violation_df["total_lowest_violations"] = violation_df[low_cols].to_numpy().sum(axis=1)
         violation_df_sorted = violation_df.sort_values(by="total_lowest_violations", ascending=True)
         st.dataframe(violation_df_sorted)
     else:
@@ -141,7 +178,7 @@ with tab4:
     # 📥 Download updated violation data
     st.download_button(
         label="📥 Download Violations CSV",
-        data=violation_df.to_csv(index=False).encode("utf-8"),
+        data=df_to_csv_bytes(violation_df),
         file_name="violations_summary.csv",
         mime="text/csv",
     )
@@ -149,8 +186,7 @@ with tab4:
 
 # 🔁 Auto-refresh
 if st.checkbox("🔄 Auto-refresh every 10 sec"):
-    time.sleep(10)
-    st.experimental_rerun()
+    st_autorefresh(interval=10_000, key="refresh")
 
 # Footer
 st.markdown("---")
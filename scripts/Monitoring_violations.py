@@ -2,17 +2,30 @@ import carla
 import time
 import csv
 import os
-import math
 import sys
 import io
-from collections import defaultdict
+import base64
 from datetime import datetime
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from _violation_common import (
+    JunctionTracker, LaneCounters, RedLightCounters, TrafficLightGeometry, wait_for_new_vehicle
+)
  
 # --- Configuration Constants ---
 ZONE_RADIUS = 2.0
+ZONE_RADIUS_SQ = ZONE_RADIUS ** 2
+ZONE_NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
 ENCRYPTION_KEY = b'27VNJatctBfMT4CEYRmiB5F_IzRa0akQ0cDHSBIRtz4='
 fernet = Fernet(ENCRYPTION_KEY)
+# The Fernet key's bytes are its own HMAC + AES-CBC keys, so derive a separate key for GCM
+GCM_KEY = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+               info=b"evtol-violations-aes-gcm").derive(base64.urlsafe_b64decode(ENCRYPTION_KEY))
+aesgcm = AESGCM(GCM_KEY)
+NONCE_SIZE = 12
+FERNET_PREFIX = b"gAAAAA"  # base64 of Fernet's 0x80 version byte + timestamp
  
 def find_violation_detection_folder():
     
@@ -51,10 +64,14 @@ if not VIOLATION_DIR:
     sys.exit(1)
  
 def encrypt_csv_data(data: str) -> bytes:
-    return fernet.encrypt(data.encode("utf-8"))
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + aesgcm.encrypt(nonce, data.encode("utf-8"), None)
  
 def decrypt_csv_data(data: bytes) -> str:
-    return fernet.decrypt(data).decode("utf-8")
+    # Older master files are Fernet tokens; they are rewritten as AES-GCM on save
+    if data.startswith(FERNET_PREFIX):
+        return fernet.decrypt(data).decode("utf-8")
+    return aesgcm.decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], None).decode("utf-8")
  
 def update_master_csv(team_name, lane, collision, redlight):
     master_path = os.path.join(VIOLATION_DIR, "master_violation.csv")
@@ -123,7 +140,7 @@ def update_master_csv(team_name, lane, collision, redlight):
 class CollisionMonitor:
     def __init__(self, vehicle, world):
         self.vehicle = vehicle; self.world = world
-        self.sensor = None; self.zones = []
+        self.sensor = None; self.zones = {}  # grid cell -> [(x, y), ...]
         self.static_count = 0; self.dynamic_count = 0
  
     def attach_sensor(self):
@@ -132,10 +149,22 @@ class CollisionMonitor:
         self.sensor.listen(self._on_collision)
         print("📡 Collision sensor attached.")
  
+    @staticmethod
+    def _cell(x, y):
+        return int(x // ZONE_RADIUS), int(y // ZONE_RADIUS)
+ 
+    def _in_zone(self, loc):
+        cx, cy = self._cell(loc.x, loc.y)
+        for dx, dy in ZONE_NEIGHBOURS:
+            for zx, zy in self.zones.get((cx + dx, cy + dy), ()):
+                if (loc.x - zx) ** 2 + (loc.y - zy) ** 2 < ZONE_RADIUS_SQ:
+                    return True
+        return False
+ 
     def _on_collision(self, event):
         loc = self.vehicle.get_location()
         self._cleanup_zones(loc)
-        if any(math.hypot(loc.x - z.x, loc.y - z.y) < ZONE_RADIUS for z in self.zones):
+        if self._in_zone(loc):
             return
         other = event.other_actor
         if "vehicle" in other.type_id:
@@ -144,13 +173,23 @@ class CollisionMonitor:
         else:
             self.static_count += 1
             print(f"💥 Static collision with {other.type_id}")
-        self.zones.append(loc)
+        self.zones.setdefault(self._cell(loc.x, loc.y), []).append((loc.x, loc.y))
  
     def _cleanup_zones(self, current_loc):
-        self.zones = [
-            z for z in self.zones
-            if math.hypot(current_loc.x - z.x, current_loc.y - z.y) < ZONE_RADIUS
-        ]
+        # Only the 9 cells around the ego can hold zones still within ZONE_RADIUS
+        if not self.zones:
+            return
+        cx, cy = self._cell(current_loc.x, current_loc.y)
+        kept = {}
+        for dx, dy in ZONE_NEIGHBOURS:
+            cell = (cx + dx, cy + dy)
+            near = [
+                (zx, zy) for zx, zy in self.zones.get(cell, ())
+                if (current_loc.x - zx) ** 2 + (current_loc.y - zy) ** 2 < ZONE_RADIUS_SQ
+            ]
+            if near:
+                kept[cell] = near
+        self.zones = kept
  
     def destroy(self):
         if self.sensor:
@@ -158,10 +197,11 @@ class CollisionMonitor:
             self.sensor.destroy()
  
 class LaneMonitor:
-    def __init__(self, vehicle, world):
+    def __init__(self, vehicle, world, world_map):
         self.vehicle = vehicle; self.world = world
         self.sensor = None; self.last_turn_time = 0
-        self.violations = defaultdict(int)
+        self.junctions = JunctionTracker(world_map)
+        self.violations = LaneCounters()
  
     def attach_sensor(self):
         bp = self.world.get_blueprint_library().find("sensor.other.lane_invasion")
@@ -175,16 +215,14 @@ class LaneMonitor:
         if now - self.last_turn_time < 5.0:
             return
         if carla.LaneMarkingType.SolidSolid in markings:
-            self.violations["illegal_double_solid_cross"] += 1; print("ILLEGAL: Crossed DOUBLE SOLID line!")
+            self.violations.double_solid += 1; print("ILLEGAL: Crossed DOUBLE SOLID line!")
         elif carla.LaneMarkingType.Solid in markings:
-            self.violations["illegal_solid_cross"] += 1; print("ILLEGAL: Crossed SOLID line!")
+            self.violations.solid += 1; print("ILLEGAL: Crossed SOLID line!")
         elif carla.LaneMarkingType.Broken in markings:
-            self.violations["unjustified_dashed_cross"] += 1; print("UNJUSTIFIED: Crossed dashed line!")
+            self.violations.dashed += 1; print("UNJUSTIFIED: Crossed dashed line!")
  
     def update_turn_status(self):
-        loc = self.vehicle.get_transform().location
-        wp = self.world.get_map().get_waypoint(loc)
-        if wp.is_junction:
+        if self.junctions.in_junction(self.vehicle.get_transform().location):
             self.last_turn_time = time.time()
  
     def destroy(self):
@@ -196,28 +234,12 @@ class RedLightMonitor:
     def __init__(self, vehicle):
         self.vehicle = vehicle
         self.violation_logged = False
-        self.violations = defaultdict(int)
+        self.violations = RedLightCounters()
+        self.lights = TrafficLightGeometry()
  
-    def get_speed(self):
+    def speed_sq(self):
         v = self.vehicle.get_velocity()
-        return math.sqrt(v.x**2 + v.y**2 + v.z**2)
- 
-    def get_stop_data(self, tl):
-        wps = tl.get_stop_waypoints()
-        if wps:
-            wp = wps[0]
-            return wp.transform.location, wp.transform.rotation.get_forward_vector()
-        return None, None
- 
-    def is_inside_trigger_box(self, tl):
-        trg = tl.trigger_volume
-        world_loc = tl.get_transform().transform(trg.location)
-        veh_loc = self.vehicle.get_location()
-        return (
-            abs(world_loc.x - veh_loc.x) <= trg.extent.x and
-            abs(world_loc.y - veh_loc.y) <= trg.extent.y and
-            abs(world_loc.z - veh_loc.z) <= trg.extent.z
-        )
+        return v.x*v.x + v.y*v.y + v.z*v.z
  
     def tick(self):
         tl = self.vehicle.get_traffic_light()
@@ -225,22 +247,25 @@ class RedLightMonitor:
             self.violation_logged = False
             return
  
-        speed = self.get_speed()
         veh_loc = self.vehicle.get_location()
-        stop_loc, stop_fwd = self.get_stop_data(tl)
+        stop_loc, stop_fwd = self.lights.stop_data(tl)
  
         violation = None; distance = 0.0
         if stop_loc:
+            fx, fy, fz = stop_fwd
             rel = veh_loc - stop_loc
-            dot = rel.x*stop_fwd.x + rel.y*stop_fwd.y + rel.z*stop_fwd.z
-            if dot > 0 and speed > 1.0:
+            dot = rel.x*fx + rel.y*fy + rel.z*fz
+            if dot > 0 and self.speed_sq() > 1.0:
                 violation, distance = "StopWaypointPassed", dot
-        elif self.is_inside_trigger_box(tl) and speed > 1.0:
+                if not self.violation_logged:
+                    self.violations.stop_waypoint += 1
+        elif self.lights.inside_trigger(tl, veh_loc) and self.speed_sq() > 1.0:
             violation = "TriggerVolume"
-            distance = veh_loc.distance(tl.get_transform().location)
+            distance = veh_loc.distance(self.lights.location(tl))
+            if not self.violation_logged:
+                self.violations.trigger_volume += 1
  
         if violation and not self.violation_logged:
-            self.violations[violation] += 1
             print(f"🚦 RED LIGHT VIOLATION: {violation} | Distance: {distance:.2f}")
             self.violation_logged = True
         elif not violation:
@@ -249,6 +274,7 @@ class RedLightMonitor:
 class TeamMonitor:
     def __init__(self, client, team_name):
         self.client = client; self.world = client.get_world()
+        self.map = self.world.get_map()
         self.team_name = team_name.lower().replace(" ", "_")
         self.vehicle = None
  
@@ -271,44 +297,47 @@ class TeamMonitor:
     def find_vehicle(self):
         existing = {v.id for v in self.world.get_actors().filter("vehicle.*")}
         print("⏳ Waiting for ego vehicle...")
-        while not self.vehicle:
-            for v in self.world.get_actors().filter("vehicle.*"):
-                if v.id not in existing:
-                    self.vehicle = v
-                    print(f"🚗 Detected ego: {v.type_id} (ID {v.id})")
-                    return
-            time.sleep(0.5)
+        self.vehicle = wait_for_new_vehicle(self.world, existing)
+        print(f"🚗 Detected ego: {self.vehicle.type_id} (ID {self.vehicle.id})")
  
     def run(self):
         self.find_vehicle()
-        self.lane = LaneMonitor(self.vehicle, self.world)
+        self.lane = LaneMonitor(self.vehicle, self.world, self.map)
         self.collision = CollisionMonitor(self.vehicle, self.world)
         self.redlight = RedLightMonitor(self.vehicle)
  
         self.lane.attach_sensor(); self.collision.attach_sensor()
  
+        # Liveness comes from the snapshot the server already pushes each tick
+        self._ego_id = self.vehicle.id; self._ego_alive = True
+        tick_cb = self.world.on_tick(self._on_world_tick)
+ 
         try:
             while True:
                 self.lane.update_turn_status()
                 self.redlight.tick()
                 self.collision._cleanup_zones(self.vehicle.get_location())
-                if self.vehicle.id not in {v.id for v in self.world.get_actors().filter("vehicle.*")}:
+                if not self._ego_alive:
                     break
                 time.sleep(0.1)
         except KeyboardInterrupt:
             pass
         finally:
+            self.world.remove_on_tick(tick_cb)
             self.cleanup()
  
+    def _on_world_tick(self, snapshot):
+        self._ego_alive = snapshot.find(self._ego_id) is not None
+ 
     def cleanup(self):
-        ds = self.lane.violations["illegal_double_solid_cross"]
-        s  = self.lane.violations["illegal_solid_cross"]
-        d  = self.lane.violations["unjustified_dashed_cross"]
+        ds = self.lane.violations.double_solid
+        s  = self.lane.violations.solid
+        d  = self.lane.violations.dashed
         total_lane = ds + s + d
         static = self.collision.static_count; dynamic = self.collision.dynamic_count
         total_coll = static + dynamic
-        stop_v = self.redlight.violations["StopWaypointPassed"]
-        trig_v = self.redlight.violations["TriggerVolume"]
+        stop_v = self.redlight.violations.stop_waypoint
+        trig_v = self.redlight.violations.trigger_volume
         total_red = stop_v + trig_v
  
         # Append to team CSV
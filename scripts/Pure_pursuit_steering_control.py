@@ -5,65 +5,98 @@ import time
 import numpy as np
 import heapq
 import itertools
+from numba import njit
 
 # ======== A* PATH PLANNER =========
+def wp_key(wp):
+    # Stable, hashable identity for a waypoint (CARLA regenerates the objects)
+    return (wp.road_id, wp.section_id, wp.lane_id, round(wp.s, 1))
+
+def wp_xyz(wp):
+    loc = wp.transform.location
+    return (loc.x, loc.y, loc.z)
+
 def a_star(start_wp, goal_wp, map):
     counter = itertools.count()
-    open_set = [(0, next(counter), start_wp)]
+    goal_xyz = wp_xyz(goal_wp)
+    start_key = wp_key(start_wp)
+
+    id_to_wp = {start_key: start_wp}
+    xyz = {start_key: wp_xyz(start_wp)}
+    successors = {}
+
+    open_set = [(0, next(counter), start_key)]
     came_from = {}
-    g_score = {start_wp: 0}
+    g_score = {start_key: 0}
 
     while open_set:
         _, _, current = heapq.heappop(open_set)
-        if current.transform.location.distance(goal_wp.transform.location) < 2.0:
-            path = [current]
+        cur_xyz = xyz[current]
+        if math.dist(cur_xyz, goal_xyz) < 2.0:
+            path = [id_to_wp[current]]
             while current in came_from:
                 current = came_from[current]
-                path.append(current)
+                path.append(id_to_wp[current])
             return list(reversed(path))
 
-        for neighbor in current.next(2.0):
-            tentative_g = g_score[current] + current.transform.location.distance(neighbor.transform.location)
+        if current not in successors:
+            keys = []
+            for nb in id_to_wp[current].next(2.0):
+                nb_key = wp_key(nb)
+                if nb_key not in id_to_wp:
+                    id_to_wp[nb_key] = nb
+                    xyz[nb_key] = wp_xyz(nb)
+                keys.append(nb_key)
+            successors[current] = keys
+
+        for neighbor in successors[current]:
+            nb_xyz = xyz[neighbor]
+            tentative_g = g_score[current] + math.dist(cur_xyz, nb_xyz)
             if neighbor not in g_score or tentative_g < g_score[neighbor]:
                 came_from[neighbor] = current
                 g_score[neighbor] = tentative_g
-                f_score = tentative_g + neighbor.transform.location.distance(goal_wp.transform.location)
+                f_score = tentative_g + math.dist(nb_xyz, goal_xyz)
                 heapq.heappush(open_set, (f_score, next(counter), neighbor))
 
     return []
 
 # ======== SMOOTH PATH =========
 def smooth_path(path, step=1.0):
-    smoothed = []
-    for i in range(len(path) - 1):
-        p1, p2 = path[i].transform.location, path[i + 1].transform.location
-        dist = p1.distance(p2)
-        for j in range(int(dist / step)):
-            t = j / int(dist / step)
-            smoothed.append(carla.Location(
-                x=p1.x + t * (p2.x - p1.x),
-                y=p1.y + t * (p2.y - p1.y),
-                z=p1.z + t * (p2.z - p1.z)))
-    smoothed.append(path[-1].transform.location)
-    return smoothed
+    pts = np.array([wp_xyz(wp) for wp in path])
+    deltas = np.diff(pts, axis=0)
+    counts = (np.linalg.norm(deltas, axis=1) / step).astype(int)
 
-# ======== PURE PURSUIT =========
-def pure_pursuit(vehicle, target):
-    loc = vehicle.get_location()
-    yaw = math.radians(vehicle.get_transform().rotation.yaw)
+    # Interpolation fraction j / n for every point j of every segment, in one pass
+    offsets = np.cumsum(counts) - counts
+    j = np.arange(counts.sum()) - np.repeat(offsets, counts)
+    t = j / np.repeat(counts, counts)
 
-    dx = target.x - loc.x
-    dy = target.y - loc.y
+    smoothed = np.repeat(pts[:-1], counts, axis=0) + t[:, None] * np.repeat(deltas, counts, axis=0)
+    # (N, 3) array of x, y, z rows, indexed directly by the control loop
+    return np.vstack([smoothed, pts[-1]])
 
-    tx = math.cos(yaw) * dx + math.sin(yaw) * dy
-    ty = -math.sin(yaw) * dx + math.cos(yaw) * dy
+# ======== PURE PURSUIT =========
+@njit(cache=True, fastmath=True)
+def _pp_core(lx, ly, yaw, gx, gy):
+    dx = gx - lx
+    dy = gy - ly
+
+    c = math.cos(yaw)
+    s = math.sin(yaw)
+    tx = c * dx + s * dy
+    ty = -s * dx + c * dy
 
     if tx <= 0.1:
         return 0.0
 
-    curvature = 2 * ty / (tx ** 2 + ty ** 2)
-    steer = np.clip(curvature * 0.9, -1.0, 1.0)
-    return steer
+    curvature = 2.0 * ty / (tx * tx + ty * ty)
+    steer = curvature * 0.9
+    return -1.0 if steer < -1.0 else (1.0 if steer > 1.0 else steer)
+
+def pure_pursuit(vehicle, tx, ty):
+    loc = vehicle.get_location()
+    yaw = math.radians(vehicle.get_transform().rotation.yaw)
+    return _pp_core(loc.x, loc.y, yaw, tx, ty)
 
 # ======== MAIN =========
 def main():
@@ -103,6 +136,10 @@ def main():
     path = smooth_path(path, step=1.5)
 
     print(f"Generated {len(path)} path points.")
+
+    # Compile the steering kernel before entering the control loop
+    _pp_core(0.0, 0.0, 0.0, 1.0, 0.0)
+
     index = 0
     try:
         while True:
@@ -123,8 +160,8 @@ def main():
                 vehicle.apply_control(carla.VehicleControl(throttle=0.0, brake=1.0))
                 break
 
-            target = path[min(index + 5, len(path) - 1)]
-            steer = pure_pursuit(vehicle, target)
+            tx, ty, _ = path[min(index + 5, len(path) - 1)]
+            steer = pure_pursuit(vehicle, tx, ty)
 
             control = carla.VehicleControl(
                 throttle=0.3,
@@ -136,7 +173,9 @@ def main():
 
             print(f"Throttle: {control.throttle:.2f} | Brake: {control.brake:.2f} | Steer: {control.steer:.3f}")
 
-            if loc.distance(target) < 2.0:
+            dx = loc.x - tx
+            dy = loc.y - ty
+            if dx * dx + dy * dy < 4.0:
                 index += 1
 
             time.sleep(1.0 / 20.0)
@@ -2,12 +2,13 @@ import carla
 import time
 import csv
 import os
+import queue
+import threading
 from datetime import datetime
 from collections import defaultdict
-import math
 
-def euclidean_distance(loc1, loc2):
-    return math.sqrt((loc1.x - loc2.x) ** 2 + (loc1.y - loc2.y) ** 2)
+ZONE_NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+ZONE_REBUILD_MOVE_SQ = 0.1 ** 2  # ego travel (m^2) before zones are re-checked; absorbs idle jitter
 
 def start_collision_monitor(
     client: carla.Client,
@@ -20,108 +21,156 @@ def start_collision_monitor(
     existing_ids = {v.id for v in world.get_actors().filter('vehicle.*')}
     ego_vehicle = None
     collision_sensor = None
-    collision_zones = []  # list of carla.Location
+    tick_cb = None
+    drain_thread = None
+    events = queue.Queue()  # raw collision tuples, formatted off the sensor thread
+    ego_alive = True
+    collision_zones = {}  # grid cell -> list of (x, y) zone centres
+    zone_radius_sq = zone_radius ** 2
+    last_cleanup_xy = None  # ego (x, y) at the last zone rebuild
     collision_count = 0
     zone_active = True
 
-    # CSV setup
-    with open(csv_path, 'w', newline='') as csvfile:
+    # CSV setup: one handle and writer for the whole run
+    with open(csv_path, 'w', newline='', buffering=1 << 16) as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=[
             "timestamp", "vehicle_type", "collision_location", "object_type", "object_name"
         ])
         writer.writeheader()
 
-    try:
-        # Wait for ego vehicle
-        while not ego_vehicle:
-            for v in world.get_actors().filter('vehicle.*'):
-                if v.id not in existing_ids:
-                    ego_vehicle = v
-                    print(f"🚗 Ego vehicle detected: {v.type_id}, ID {v.id}")
+        try:
+            # Wait for ego vehicle
+            while not ego_vehicle:
+                for v in world.get_actors().filter('vehicle.*'):
+                    if v.id not in existing_ids:
+                        ego_vehicle = v
+                        print(f"🚗 Ego vehicle detected: {v.type_id}, ID {v.id}")
+                        break
+                time.sleep(0.5)
+
+            # Attach sensor
+            bp = world.get_blueprint_library().find('sensor.other.collision')
+            collision_sensor = world.spawn_actor(bp, carla.Transform(), attach_to=ego_vehicle)
+
+            def zone_cell(x, y):
+                return int(x // zone_radius), int(y // zone_radius)
+
+            def is_in_existing_zone(new_loc):
+                cx, cy = zone_cell(new_loc.x, new_loc.y)
+                for dx, dy in ZONE_NEIGHBOURS:
+                    for zx, zy in collision_zones.get((cx + dx, cy + dy), ()):
+                        if (new_loc.x - zx) ** 2 + (new_loc.y - zy) ** 2 < zone_radius_sq:
+                            return True
+                return False
+
+            def cleanup_zones(current_loc):
+                # Remove zones if ego is far from them; only the 9 cells around
+                # the ego can still hold zones within zone_radius
+                cx, cy = zone_cell(current_loc.x, current_loc.y)
+                kept = {}
+                for dx, dy in ZONE_NEIGHBOURS:
+                    cell = (cx + dx, cy + dy)
+                    near = [
+                        (zx, zy) for zx, zy in collision_zones.get(cell, ())
+                        if (current_loc.x - zx) ** 2 + (current_loc.y - zy) ** 2 < zone_radius_sq
+                    ]
+                    if near:
+                        kept[cell] = near
+                return kept
+
+            def on_collision(event):
+                nonlocal collision_count, collision_zones, last_cleanup_xy
+
+                loc = ego_vehicle.get_location()
+
+                # Check if this collision is near any previous one
+                if is_in_existing_zone(loc):
+                    return  # Skip duplicate
+
+                # Register new zone
+                collision_zones.setdefault(zone_cell(loc.x, loc.y), []).append((loc.x, loc.y))
+                last_cleanup_xy = None
+                collision_count += 1
+
+                # Hand off raw values; formatting and I/O happen in drain_events
+                events.put_nowait((time.time(), loc.x, loc.y, loc.z, event.other_actor.type_id))
+
+            def drain_events():
+                while True:
+                    item = events.get()
+                    if item is None:
+                        return
+                    ts, x, y, z, object_name = item
+                    loc_str = f"({x:.2f}, {y:.2f}, {z:.2f})"
+
+                    # Object info
+                    obj_type = "static"
+                    if "vehicle" in object_name or "walker" in object_name:
+                        obj_type = "running"
+
+                    timestamp = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+                    print(f"\n💥 Collision at {loc_str}")
+                    print(f"🕒 Time: {timestamp}")
+                    print(f"🚗 Ego Vehicle: {ego_type}")
+                    print(f"📦 Object: {object_name} ({obj_type})")
+
+                    writer.writerow({
+                        "timestamp": timestamp,
+                        "vehicle_type": ego_type,
+                        "collision_location": loc_str,
+                        "object_type": obj_type,
+                        "object_name": object_name
+                    })
+
+            ego_type = ego_vehicle.type_id
+            drain_thread = threading.Thread(target=drain_events, daemon=True)
+            drain_thread.start()
+
+            collision_sensor.listen(on_collision)
+            print(f"📡 Sensor attached to vehicle ID {ego_vehicle.id}")
+
+            # Liveness comes from the snapshot the server already pushes each tick
+            def on_world_tick(snapshot):
+                nonlocal ego_alive
+                ego_alive = snapshot.find(ego_vehicle.id) is not None
+
+            tick_cb = world.on_tick(on_world_tick)
+
+            # Monitoring loop
+            while True:
+                # Remove old zones if ego moved away; nothing can expire while
+                # there are no zones or the ego is standing still
+                loc = ego_vehicle.get_location()
+                if collision_zones and (
+                    last_cleanup_xy is None
+                    or (loc.x - last_cleanup_xy[0]) ** 2 + (loc.y - last_cleanup_xy[1]) ** 2 >= ZONE_REBUILD_MOVE_SQ
+                ):
+                    collision_zones = cleanup_zones(loc)
+                    last_cleanup_xy = (loc.x, loc.y)
+
+                if not ego_alive:
+                    print("🛑 Vehicle removed. Exiting.")
                     break
-            time.sleep(0.5)
-
-        # Attach sensor
-        bp = world.get_blueprint_library().find('sensor.other.collision')
-        collision_sensor = world.spawn_actor(bp, carla.Transform(), attach_to=ego_vehicle)
-
-        def is_in_existing_zone(new_loc):
-            for zone in collision_zones:
-                if euclidean_distance(new_loc, zone) < zone_radius:
-                    return True
-            return False
-
-        def cleanup_zones(current_loc):
-            # Remove zones if ego is far from them
-            return [z for z in collision_zones if euclidean_distance(current_loc, z) < zone_radius]
-
-        def on_collision(event):
-            nonlocal collision_count, collision_zones
-
-            loc = ego_vehicle.get_location()
-            loc_str = f"({loc.x:.2f}, {loc.y:.2f}, {loc.z:.2f})"
-
-            # Check if this collision is near any previous one
-            if is_in_existing_zone(loc):
-                return  # Skip duplicate
-
-            # Register new zone
-            collision_zones.append(loc)
-            collision_count += 1
-
-            # Object info
-            actor = event.other_actor
-            obj_type = "static"
-            if "vehicle" in actor.type_id or "walker" in actor.type_id:
-                obj_type = "running"
-
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            print(f"\n💥 Collision at {loc_str}")
-            print(f"🕒 Time: {timestamp}")
-            print(f"🚗 Ego Vehicle: {ego_vehicle.type_id}")
-            print(f"📦 Object: {actor.type_id} ({obj_type})")
-
-            with open(csv_path, 'a', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=[
-                    "timestamp", "vehicle_type", "collision_location", "object_type", "object_name"
-                ])
-                writer.writerow({
-                    "timestamp": timestamp,
-                    "vehicle_type": ego_vehicle.type_id,
-                    "collision_location": loc_str,
-                    "object_type": obj_type,
-                    "object_name": actor.type_id
-                })
-
-        collision_sensor.listen(on_collision)
-        print(f"📡 Sensor attached to vehicle ID {ego_vehicle.id}")
-
-        # Monitoring loop
-        while True:
-            # Remove old zones if ego moved away
-            loc = ego_vehicle.get_location()
-            collision_zones = cleanup_zones(loc)
-
-            active_ids = {v.id for v in world.get_actors().filter('vehicle.*')}
-            if ego_vehicle.id not in active_ids:
-                print("🛑 Vehicle removed. Exiting.")
-                break
-            time.sleep(0.5)
-
-    except KeyboardInterrupt:
-        print("🛑 Interrupted manually.")
-    finally:
-        if collision_sensor:
-            collision_sensor.stop()
-            collision_sensor.destroy()
-
-        print(f"\n📊 Total collisions detected: {collision_count}")
-        with open(csv_path, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow([])
-            writer.writerow(["TOTAL_COLLISIONS", collision_count])
-        print(f"📝 Summary saved to CSV: {csv_path}")
+                time.sleep(0.5)
+
+        except KeyboardInterrupt:
+            print("🛑 Interrupted manually.")
+        finally:
+            if tick_cb is not None:
+                world.remove_on_tick(tick_cb)
+            if collision_sensor:
+                collision_sensor.stop()
+                collision_sensor.destroy()
+            if drain_thread is not None:
+                events.put(None)
+                drain_thread.join()
+
+            print(f"\n📊 Total collisions detected: {collision_count}")
+            summary = csv.writer(csvfile)
+            summary.writerow([])
+            summary.writerow(["TOTAL_COLLISIONS", collision_count])
+            print(f"📝 Summary saved to CSV: {csv_path}")
 client = carla.Client("localhost", 2000)
 client.set_timeout(10.0)
 
@@ -3,16 +3,20 @@ import time
 import csv
 import os
 import math
-from collections import defaultdict
+import numpy as np
 from datetime import datetime
+from _violation_common import (
+    JunctionTracker, LaneCounters, RedLightCounters, TrafficLightGeometry, wait_for_new_vehicle
+)
 
 ZONE_RADIUS = 2.0
+ZONE_RADIUS_SQ = ZONE_RADIUS ** 2
 OUTPUT_DIR = 'output'
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 
-def euclidean_distance(loc1, loc2):
-    return math.sqrt((loc1.x - loc2.x) ** 2 + (loc1.y - loc2.y) ** 2)
+def squared_distances(zones, loc):
+    return ((zones - (loc.x, loc.y)) ** 2).sum(axis=1)
 
 
 class CollisionMonitor:
@@ -20,7 +24,7 @@ class CollisionMonitor:
         self.vehicle = vehicle
         self.world = world
         self.sensor = None
-        self.zones = []
+        self.zones = np.empty((0, 2))  # one (x, y) row per zone
         self.static_count = 0
         self.dynamic_count = 0
 
@@ -34,7 +38,7 @@ class CollisionMonitor:
         loc = self.vehicle.get_location()
         self._cleanup_zones(loc)
 
-        if any(euclidean_distance(loc, zone) < ZONE_RADIUS for zone in self.zones):
+        if (squared_distances(self.zones, loc) < ZONE_RADIUS_SQ).any():
             return
 
         other = event.other_actor
@@ -45,10 +49,11 @@ class CollisionMonitor:
             self.static_count += 1
             print(f"💥 Static collision with {other.type_id}")
 
-        self.zones.append(loc)
+        self.zones = np.vstack([self.zones, (loc.x, loc.y)])
 
     def _cleanup_zones(self, current_loc):
-        self.zones = [z for z in self.zones if euclidean_distance(current_loc, z) < ZONE_RADIUS]
+        if len(self.zones):
+            self.zones = self.zones[squared_distances(self.zones, current_loc) < ZONE_RADIUS_SQ]
 
     def destroy(self):
         if self.sensor:
@@ -65,7 +70,8 @@ class LaneMonitor:
         self.world = world
         self.sensor = None
         self.last_turn_time = 0
-        self.violations = defaultdict(int)
+        self.junctions = JunctionTracker(world.get_map())
+        self.violations = LaneCounters()
 
     def attach_sensor(self):
         bp = self.world.get_blueprint_library().find('sensor.other.lane_invasion')
@@ -80,19 +86,17 @@ class LaneMonitor:
             return
 
         if carla.LaneMarkingType.SolidSolid in markings:
-            self.violations["illegal_double_solid_cross"] += 1
+            self.violations.double_solid += 1
             print("ILLEGAL: Crossed DOUBLE SOLID line!")
         elif carla.LaneMarkingType.Solid in markings:
-            self.violations["illegal_solid_cross"] += 1
+            self.violations.solid += 1
             print("ILLEGAL: Crossed SOLID line!")
         elif carla.LaneMarkingType.Broken in markings:
-            self.violations["unjustified_dashed_cross"] += 1
+            self.violations.dashed += 1
             print("UNJUSTIFIED: Crossed dashed line!")
 
     def update_turn_status(self):
-        loc = self.vehicle.get_transform().location
-        wp = self.world.get_map().get_waypoint(loc)
-        if wp.is_junction:
+        if self.junctions.in_junction(self.vehicle.get_transform().location):
             self.last_turn_time = time.time()
 
     def destroy(self):
@@ -105,28 +109,13 @@ class RedLightMonitor:
     def __init__(self, vehicle):
         self.vehicle = vehicle
         self.violation_logged = False
-        self.violations = defaultdict(int)
+        self.violations = RedLightCounters()
+        self.lights = TrafficLightGeometry()
 
     def get_speed(self):
         v = self.vehicle.get_velocity()
         return math.sqrt(v.x ** 2 + v.y ** 2 + v.z ** 2)
 
-    def get_stop_data(self, tl):
-        waypoints = tl.get_stop_waypoints()
-        if waypoints:
-            wp = waypoints[0]
-            return wp.transform.location, wp.transform.rotation.get_forward_vector()
-        return None, None
-
-    def is_inside_trigger_box(self, tl):
-        trigger = tl.trigger_volume
-        world_loc = tl.get_transform().transform(trigger.location)
-        veh_loc = self.vehicle.get_location()
-        dx = abs(world_loc.x - veh_loc.x)
-        dy = abs(world_loc.y - veh_loc.y)
-        dz = abs(world_loc.z - veh_loc.z)
-        return dx <= trigger.extent.x and dy <= trigger.extent.y and dz <= trigger.extent.z
-
     def tick(self):
         tl = self.vehicle.get_traffic_light()
         if tl is None:
@@ -139,23 +128,27 @@ class RedLightMonitor:
 
         speed = self.get_speed()
         veh_loc = self.vehicle.get_location()
-        stop_loc, stop_fwd = self.get_stop_data(tl)
+        stop_loc, stop_fwd = self.lights.stop_data(tl)
 
         violation_type = None
         distance_past = None
 
         if stop_loc:
+            fx, fy, fz = stop_fwd
             rel = veh_loc - stop_loc
-            dot = rel.x * stop_fwd.x + rel.y * stop_fwd.y + rel.z * stop_fwd.z
+            dot = rel.x * fx + rel.y * fy + rel.z * fz
             if dot > 0 and speed > 1.0:
                 violation_type = "StopWaypointPassed"
                 distance_past = dot
-        elif self.is_inside_trigger_box(tl) and speed > 1.0:
+                if not self.violation_logged:
+                    self.violations.stop_waypoint += 1
+        elif self.lights.inside_trigger(tl, veh_loc) and speed > 1.0:
             violation_type = "TriggerVolume"
-            distance_past = veh_loc.distance(tl.get_transform().location)
+            distance_past = veh_loc.distance(self.lights.location(tl))
+            if not self.violation_logged:
+                self.violations.trigger_volume += 1
 
         if violation_type and not self.violation_logged:
-            self.violations[violation_type] += 1
             print(f"🚦 RED LIGHT VIOLATION: {violation_type} | Distance Past: {distance_past:.2f}")
             self.violation_logged = True
         elif not violation_type:
@@ -199,13 +192,8 @@ class TeamMonitor:
     def find_vehicle(self):
         existing_ids = {v.id for v in self.world.get_actors().filter('vehicle.*')}
         print("⏳ Waiting for ego vehicle to spawn...")
-        while not self.vehicle:
-            for v in self.world.get_actors().filter('vehicle.*'):
-                if v.id not in existing_ids:
-                    self.vehicle = v
-                    print(f"🚗 Ego vehicle detected: {v.type_id}, ID {v.id}")
-                    return
-            time.sleep(0.5)
+        self.vehicle = wait_for_new_vehicle(self.world, existing_ids)
+        print(f"🚗 Ego vehicle detected: {self.vehicle.type_id}, ID {self.vehicle.id}")
 
     def run(self):
         self.find_vehicle()
@@ -222,8 +210,7 @@ class TeamMonitor:
                 self.lane_monitor.update_turn_status()
                 self.redlight_monitor.tick()
                 self.collision_monitor._cleanup_zones(self.vehicle.get_transform().location)
-                active_ids = {v.id for v in self.world.get_actors().filter('vehicle.*')}
-                if self.vehicle.id not in active_ids:
+                if not self.vehicle.is_alive:
                     print(" Vehicle removed. Exiting.")
                     break
                 time.sleep(0.1)
@@ -234,9 +221,9 @@ class TeamMonitor:
 
     def cleanup(self):
         # LANE
-        double_solid = self.lane_monitor.violations["illegal_double_solid_cross"]
-        solid = self.lane_monitor.violations["illegal_solid_cross"]
-        dashed = self.lane_monitor.violations["unjustified_dashed_cross"]
+        double_solid = self.lane_monitor.violations.double_solid
+        solid = self.lane_monitor.violations.solid
+        dashed = self.lane_monitor.violations.dashed
         total_lane = double_solid + solid + dashed
 
         # COLLISIONS
@@ -245,8 +232,8 @@ class TeamMonitor:
         total_coll = static + dynamic
 
         # RED LIGHT
-        stop_violation = self.redlight_monitor.violations["StopWaypointPassed"]
-        trigger_violation = self.redlight_monitor.violations["TriggerVolume"]
+        stop_violation = self.redlight_monitor.violations.stop_waypoint
+        trigger_violation = self.redlight_monitor.violations.trigger_volume
         total_red = stop_violation + trigger_violation
 
         print("\n=== Summary ===")
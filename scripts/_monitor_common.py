@@ -0,0 +1,119 @@
+import os
+import csv
+import time
+import atexit
+import psutil
+
+try:
+    import pynvml
+except ImportError:  # no NVIDIA tooling; GPU metrics read as zero
+    pynvml = None
+
+# Shared sampling helpers for monitor_benchmark_for_docker.py and monitor_benchmark_for_python.py
+
+_freq_max = None  # cached max CPU frequency
+
+def prime_cpu_percent():
+    # cpu_percent(interval=None) reports usage since the previous call, so seed
+    # the per-core counters once and let one interval elapse
+    psutil.cpu_percent(interval=None, percpu=True)
+    time.sleep(1)
+
+def sleep_until_next_tick(next_tick, period=1.0):
+    # Sleep to a fixed monotonic deadline so sampling time doesn't stretch the period;
+    # after an overrun, restart the schedule instead of bursting to catch up
+    next_tick += period
+    remaining = next_tick - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+        return next_tick
+    return time.monotonic()
+
+def sample_cpu():
+    # One /proc/stat pass gives both the overall load and the core imbalance
+    per_core = psutil.cpu_percent(interval=None, percpu=True)
+    if not per_core:
+        return 0.0, 0.0
+    return sum(per_core) / len(per_core), max(per_core) - min(per_core)
+
+def get_freq_ratio():
+    global _freq_max
+    try:
+        freq = psutil.cpu_freq()
+        if _freq_max is None and freq:
+            _freq_max = freq.max  # fixed per boot
+        return round(freq.current / _freq_max, 2) if freq and _freq_max else 0
+    except:
+        return 0
+
+class GpuSampler:
+    # NVML is initialised once; device handles stay valid for the process lifetime
+    def __init__(self):
+        self._handles = None
+
+    def _get_handles(self):
+        if self._handles is None:
+            # No driver/GPU won't change at runtime, so any failure here is final; don't retry every tick
+            self._handles = []
+            try:
+                pynvml.nvmlInit()
+                atexit.register(pynvml.nvmlShutdown)
+                self._handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+            except Exception as e:
+                print(f"[GPU METRIC ERROR] NVML unavailable: {e}")
+        return self._handles
+
+    def sample(self):
+        # Mean (utilisation %, memory %, temperature) across all GPUs
+        if pynvml is None:
+            return 0.0, 0.0, 0.0
+        try:
+            handles = self._get_handles()
+            if not handles:
+                return 0.0, 0.0, 0.0
+
+            total_util = total_mem = total_temp = 0.0
+            for h in handles:
+                mem = pynvml.nvmlDeviceGetMemoryInfo(h)
+                total_util += pynvml.nvmlDeviceGetUtilizationRates(h).gpu
+                total_mem += (mem.used / mem.total) * 100
+                total_temp += pynvml.nvmlDeviceGetTemperature(h, pynvml.NVML_TEMPERATURE_GPU)
+
+            gpu_count = len(handles)
+            return (
+                total_util / gpu_count,
+                total_mem / gpu_count,
+                total_temp / gpu_count
+            )
+
+        except Exception as e:
+            print(f"[GPU METRIC ERROR] {e}")
+            return 0.0, 0.0, 0.0
+
+class MetricAccumulator:
+    # Running totals per metric; O(1) memory for any run length
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.sums = {key: 0.0 for key in self.keys}
+        self.samples = 0
+
+    def add(self, **values):
+        for key, value in values.items():
+            self.sums[key] += value
+        self.samples += 1
+
+    def averages(self):
+        return {key: round(self.sums[key] / self.samples, 2) if self.samples else 0 for key in self.keys}
+
+def save_results(averages, weights, team_name, csv_path):
+    final_score = round(sum(weights[k] * averages[k] for k in weights), 2)
+    averages["final_score"] = final_score
+
+    print(f"\nFinal Score for {team_name}: {final_score:.2f}")
+
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(averages.keys()))
+        writer.writeheader()
+        writer.writerow(averages)
+
+    print(f"\nResults saved to: {os.path.abspath(csv_path)}")
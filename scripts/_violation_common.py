@@ -0,0 +1,83 @@
+import time
+
+# Shared helpers for Monitoring_violations.py, Voilations_monitor.py and monitor_violations_linux.py
+
+def wait_for_new_vehicle(world, existing_ids, delay=0.5, max_delay=2.0):
+    # Poll for a vehicle that wasn't there at startup. The poll interval doubles
+    # while nothing spawns, capped so a late ego still gets its sensors promptly
+    while True:
+        for v in world.get_actors().filter("vehicle.*"):
+            if v.id not in existing_ids:
+                return v
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+class LaneCounters:
+    __slots__ = ("double_solid", "solid", "dashed")
+
+    def __init__(self):
+        self.double_solid = 0
+        self.solid = 0
+        self.dashed = 0
+
+class RedLightCounters:
+    __slots__ = ("stop_waypoint", "trigger_volume")
+
+    def __init__(self):
+        self.stop_waypoint = 0
+        self.trigger_volume = 0
+
+class JunctionTracker:
+    # Whether a location is inside a junction. Junction status can't flip within
+    # a metre of travel, so the map is only re-queried once the vehicle has moved that far
+    def __init__(self, world_map, min_move=1.0):
+        self.map = world_map
+        self._min_move_sq = min_move * min_move
+        self._last_xy = None
+        self._in_junction = False
+
+    def in_junction(self, loc):
+        if self._last_xy is not None:
+            dx = loc.x - self._last_xy[0]
+            dy = loc.y - self._last_xy[1]
+            if dx * dx + dy * dy < self._min_move_sq:
+                return self._in_junction
+        self._last_xy = (loc.x, loc.y)
+        self._in_junction = self.map.get_waypoint(loc).is_junction
+        return self._in_junction
+
+class TrafficLightGeometry:
+    # Stop-line and trigger-box data per traffic light id. Lights are static actors,
+    # so each is read over RPC the first time it turns red in front of the ego and reused after
+    def __init__(self):
+        self._stops = {}  # light id -> (stop location, (fx, fy, fz)) or (None, None)
+        self._triggers = {}  # light id -> (trigger centre in world space, extent, light location)
+
+    def stop_data(self, tl):
+        if tl.id not in self._stops:
+            wps = tl.get_stop_waypoints()
+            if wps:
+                wp = wps[0]
+                fwd = wp.transform.rotation.get_forward_vector()
+                self._stops[tl.id] = wp.transform.location, (fwd.x, fwd.y, fwd.z)
+            else:
+                self._stops[tl.id] = None, None
+        return self._stops[tl.id]
+
+    def _trigger(self, tl):
+        if tl.id not in self._triggers:
+            trg = tl.trigger_volume
+            transform = tl.get_transform()
+            self._triggers[tl.id] = (transform.transform(trg.location), trg.extent, transform.location)
+        return self._triggers[tl.id]
+
+    def inside_trigger(self, tl, loc):
+        centre, extent, _ = self._trigger(tl)
+        return (
+            abs(centre.x - loc.x) <= extent.x and
+            abs(centre.y - loc.y) <= extent.y and
+            abs(centre.z - loc.z) <= extent.z
+        )
+
+    def location(self, tl):
+        return self._trigger(tl)[2]
@@ -3,12 +3,17 @@ import psutil
 import time
 import threading
 import traceback
-import csv
-from collections import defaultdict
 import sys
 import subprocess
-import re
-import shutil
+from _monitor_common import (
+    GpuSampler, MetricAccumulator, get_freq_ratio, prime_cpu_percent,
+    sample_cpu, save_results, sleep_until_next_tick
+)
+
+try:
+    import docker
+except ImportError:  # fall back to the docker CLI
+    docker = None
 
 WEIGHTS = {
     "cpu": 0.1,
@@ -21,19 +26,23 @@ WEIGHTS = {
     "gpu_temp": 0.1  
 }
 
-def get_cpu_usage():
-    return psutil.cpu_percent(interval=1)
-
-def get_core_imbalance():
-    per_core = psutil.cpu_percent(interval=1, percpu=True)
-    return max(per_core) - min(per_core) if per_core else 0.0
-
-def get_freq_ratio():
-    try:
-        freq = psutil.cpu_freq()
-        return round(freq.current / freq.max, 2) if freq and freq.max else 0
-    except:
-        return 0
+def _parse_mem(s):
+    # "123.4MiB" -> 123.4; scan past the number instead of regex-stripping it
+    s = s.strip()
+    i = 0
+    while i < len(s) and (s[i].isdigit() or s[i] == '.'):
+        i += 1
+    value = float(s[:i])
+    unit = s[i:i + 1]
+    if unit == 'B':
+        return value / (1024 ** 2)
+    if unit == 'k' or unit == 'K':
+        return value / 1024
+    if unit == 'G':
+        return value * 1024
+    if unit == 'T':
+        return value * (1024 ** 2)
+    return value  # MiB
 
 def get_docker_metrics(container_name):
     if not container_name:
@@ -47,9 +56,8 @@ def get_docker_metrics(container_name):
         output = subprocess.check_output(cmd, encoding="utf-8").strip()
         cpu_str, mem_str = output.split(',')
 
-        cpu = float(cpu_str.strip('%'))
-        mem_used, _ = mem_str.strip().split('/')
-        mem_mb = float(re.sub(r'[^\d.]', '', mem_used))  # crude parsing
+        cpu = float(cpu_str.rstrip('%'))
+        mem_mb = _parse_mem(mem_str[:mem_str.index('/')])
 
         return round(cpu, 2), round(mem_mb, 2)
 
@@ -57,73 +65,200 @@ def get_docker_metrics(container_name):
         print(f"[DOCKER METRIC ERROR] {e}")
         return 0.0, 0.0
 
-def get_gpu_metrics():
-    possible_paths = ["nvidia-smi", "/usr/bin/nvidia-smi", "/usr/local/bin/nvidia-smi"]
-    nvidia_smi_path = next((shutil.which(p) for p in possible_paths if shutil.which(p)), None)
-
-    if not nvidia_smi_path:
-        print("[GPU METRIC ERROR] 'nvidia-smi' not found.")
-        return 0.0, 0.0, 0.0
-
+class DockerStatsStreamer(threading.Thread):
+    """Holds the latest (cpu %, mem MB) sample from a streamed container stats feed.
+
+    ``latest`` is None until the first real frame arrives and again once the stream ends.
+    """
+
+    def __init__(self, container_name):
+        super().__init__(daemon=True)
+        self.container_name = container_name
+        self._latest = None
+        self._lock = threading.Lock()
+
+    @property
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+    def run(self):
+        try:
+            client = docker.from_env()
+            container = client.containers.get(self.container_name)
+            for frame in container.stats(stream=True, decode=True):
+                sample = self._parse(frame)
+                if sample is not None:
+                    with self._lock:
+                        self._latest = sample
+        except Exception as e:
+            print(f"[DOCKER METRIC ERROR] {e}")
+        finally:
+            # Container stopped or the daemon dropped the stream; don't leave a stale sample behind
+            with self._lock:
+                self._latest = None
+
+    @staticmethod
+    def _parse(frame):
+        cpu, pre = frame.get("cpu_stats", {}), frame.get("precpu_stats", {})
+        if not pre.get("system_cpu_usage"):
+            return None  # first frame has no previous sample to diff against
+
+        cpu_delta = cpu["cpu_usage"]["total_usage"] - pre["cpu_usage"]["total_usage"]
+        system_delta = cpu["system_cpu_usage"] - pre["system_cpu_usage"]
+        online_cpus = cpu.get("online_cpus") or len(cpu["cpu_usage"].get("percpu_usage") or []) or 1
+        cpu_pct = (cpu_delta / system_delta) * online_cpus * 100 if system_delta > 0 else 0.0
+
+        # Same as `docker stats`: usage minus reclaimable page cache
+        mem = frame.get("memory_stats", {})
+        mem_stats = mem.get("stats", {})
+        cache = mem_stats.get("inactive_file", mem_stats.get("total_inactive_file", 0))
+        mem_mb = (mem.get("usage", 0) - cache) / (1024 ** 2)
+
+        return round(cpu_pct, 2), round(mem_mb, 2)
+
+def resolve_container_id(container_name):
     try:
-        result = subprocess.check_output(
-            [nvidia_smi_path, "--query-gpu=utilization.gpu,memory.used,memory.total,temperature.gpu",
-             "--format=csv,noheader,nounits"],
-            encoding='utf-8'
+        if docker is not None:
+            return docker.from_env().containers.get(container_name).id
+        return subprocess.check_output(
+            ["docker", "inspect", "-f", "{{.Id}}", container_name], encoding="utf-8"
         ).strip()
-
-        lines = result.splitlines()
-        if not lines:
-            return 0.0, 0.0, 0.0
-
-        total_util = total_mem = total_temp = 0.0
-        for line in lines:
-            parts = re.split(r',\s*', line)
-            if len(parts) != 4:
-                continue
-            util = float(parts[0])
-            mem_used = float(parts[1])
-            mem_total = float(parts[2])
-            temp = float(parts[3])
-            total_util += util
-            total_mem += (mem_used / mem_total) * 100
-            total_temp += temp
-
-        gpu_count = len(lines)
-        return (
-            total_util / gpu_count,
-            total_mem / gpu_count,
-            total_temp / gpu_count
-        )
-
     except Exception as e:
-        print(f"[GPU METRIC ERROR] {e}")
-        return 0.0, 0.0, 0.0
+        print(f"[DOCKER METRIC ERROR] {e}")
+        return None
+
+class CgroupStatsReader:
+    """Reads a container's CPU and memory counters straight from its cgroup files (Linux)."""
+
+    CGROUP_ROOT = "/sys/fs/cgroup"
+
+    def __init__(self, cpu_path, mem_path, mem_stat_path, version):
+        self.version = version
+        fds = []
+        try:
+            for path in (cpu_path, mem_path, mem_stat_path):
+                fds.append(os.open(path, os.O_RDONLY))
+            self._cpu_fd, self._mem_fd, self._mem_stat_fd = fds
+            self._prev = (self._cpu_ns(), time.monotonic_ns())
+        except Exception:
+            for fd in fds:
+                os.close(fd)
+            raise
+
+    @classmethod
+    def for_container(cls, container_name):
+        # Check the platform before resolving the id, which costs an SDK call or a subprocess
+        if not sys.platform.startswith("linux"):
+            return None
+        container_id = resolve_container_id(container_name)
+        if not container_id:
+            return None
+
+        try:
+            return cls._open(container_id)
+        except (OSError, ValueError) as e:
+            print(f"[DOCKER METRIC ERROR] {e}")
+            return None
+
+    @classmethod
+    def _open(cls, container_id):
+        scopes = [f"system.slice/docker-{container_id}.scope", f"docker/{container_id}"]
+        root = cls.CGROUP_ROOT
+        for scope in scopes:
+            # cgroup v2: unified hierarchy
+            base = os.path.join(root, scope)
+            if os.path.exists(os.path.join(base, "cpu.stat")):
+                return cls(os.path.join(base, "cpu.stat"), os.path.join(base, "memory.current"),
+                           os.path.join(base, "memory.stat"), version=2)
+            # cgroup v1: per-controller hierarchies
+            for cpu_ctrl in ("cpuacct", "cpu,cpuacct"):
+                cpu_path = os.path.join(root, cpu_ctrl, scope, "cpuacct.usage")
+                mem_base = os.path.join(root, "memory", scope)
+                if os.path.exists(cpu_path) and os.path.exists(mem_base):
+                    return cls(cpu_path, os.path.join(mem_base, "memory.usage_in_bytes"),
+                               os.path.join(mem_base, "memory.stat"), version=1)
+        return None
+
+    @staticmethod
+    def _read(fd):
+        return os.pread(fd, 16384, 0).decode()
+
+    @staticmethod
+    def _stat_field(text, key):
+        for line in text.splitlines():
+            name, _, value = line.partition(" ")
+            if name == key:
+                return int(value)
+        return 0
+
+    def _cpu_ns(self):
+        if self.version == 2:
+            return self._stat_field(self._read(self._cpu_fd), "usage_usec") * 1000
+        return int(self._read(self._cpu_fd))
+
+    def sample(self):
+        try:
+            return self._sample()
+        except (OSError, ValueError) as e:
+            print(f"[DOCKER METRIC ERROR] {e}")
+            return 0.0, 0.0
+
+    def _sample(self):
+        now = time.monotonic_ns()
+        usage = self._cpu_ns()
+        prev_usage, prev_time = self._prev
+        self._prev = (usage, now)
+        # Same scale as `docker stats`: 100% per fully busy CPU
+        cpu = (usage - prev_usage) / (now - prev_time) * 100 if now > prev_time else 0.0
+
+        # Same as `docker stats`: usage minus reclaimable page cache
+        inactive_key = "inactive_file" if self.version == 2 else "total_inactive_file"
+        mem = int(self._read(self._mem_fd)) - self._stat_field(self._read(self._mem_stat_fd), inactive_key)
+        return round(cpu, 2), round(mem / (1024 ** 2), 2)
+
+    def close(self):
+        for fd in (self._cpu_fd, self._mem_fd, self._mem_stat_fd):
+            os.close(fd)
 
 def log_metrics(team_name, csv_path, container_name):
     total_ram = psutil.virtual_memory().total / (1024 ** 2)  # MB
-    stats = defaultdict(list)
+    metrics = MetricAccumulator(WEIGHTS)
+    gpu = GpuSampler()
     start_time = time.time()
 
+    # Prefer direct cgroup reads, then the streamed SDK feed, then the docker CLI
+    cgroup = CgroupStatsReader.for_container(container_name) if container_name else None
+    streamer = None
+    if cgroup is None and container_name and docker is not None:
+        streamer = DockerStatsStreamer(container_name)
+        streamer.start()
+
     try:
+        prime_cpu_percent()
+        next_tick = time.monotonic()
         while True:
-            cpu = get_cpu_usage()
-            core_imbalance = get_core_imbalance()
+            cpu, core_imbalance = sample_cpu()
             freq_ratio = get_freq_ratio()
-            docker_cpu, docker_mem = get_docker_metrics(container_name)
+            # The streamer has no sample before its first real frame or after the stream ends;
+            # use the CLI for those ticks instead of a placeholder or stale value
+            streamed = streamer.latest if streamer else None
+            if cgroup:
+                docker_cpu, docker_mem = cgroup.sample()
+            elif streamed is not None:
+                docker_cpu, docker_mem = streamed
+            else:
+                docker_cpu, docker_mem = get_docker_metrics(container_name)
             norm_docker_mem = (docker_mem / total_ram) * 100 if total_ram else 0.0
-            gpu_util, gpu_mem, gpu_temp = get_gpu_metrics()
+            gpu_util, gpu_mem, gpu_temp = gpu.sample()
 
-            stats["cpu"].append(cpu)
-            stats["core_imbalance"].append(core_imbalance)
-            stats["freq_ratio"].append(freq_ratio)
-            stats["docker_cpu"].append(docker_cpu)
-            stats["docker_mem"].append(norm_docker_mem)
-            stats["gpu_util"].append(gpu_util)
-            stats["gpu_mem"].append(gpu_mem)
-            stats["gpu_temp"].append(gpu_temp)
+            metrics.add(
+                cpu=cpu, core_imbalance=core_imbalance, freq_ratio=freq_ratio,
+                docker_cpu=docker_cpu, docker_mem=norm_docker_mem,
+                gpu_util=gpu_util, gpu_mem=gpu_mem, gpu_temp=gpu_temp
+            )
 
-            time.sleep(1)
+            next_tick = sleep_until_next_tick(next_tick)
 
     except KeyboardInterrupt:
         print("\nMonitoring interrupted manually.")
@@ -132,25 +267,20 @@ def log_metrics(team_name, csv_path, container_name):
         print("[Error]", e)
         traceback.print_exc()
 
+    if cgroup:
+        cgroup.close()
+
     duration = time.time() - start_time
 
     if duration < 60:
         print(f"\nMonitoring ran for less than 60 seconds ({int(duration)}s). Skipping CSV generation.")
         return
 
-    def avg(key): return sum(stats[key]) / len(stats[key]) if stats[key] else 0
-    averages = {key: round(avg(key), 2) for key in WEIGHTS}
-    final_score = round(sum(WEIGHTS[k] * averages[k] for k in WEIGHTS), 2)
-    averages["final_score"] = final_score
-
-    print(f"\nFinal Score for {team_name}: {final_score:.2f}")
-
-    with open(csv_path, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=list(averages.keys()))
-        writer.writeheader()
-        writer.writerow(averages)
+    if not metrics.samples:
+        print("\nNo samples were collected. Skipping CSV generation.")
+        return
 
-    print(f"\nResults saved to: {os.path.abspath(csv_path)}")
+    save_results(metrics.averages(), WEIGHTS, team_name, csv_path)
 
 def monitor_only(team_name, container_name):
     csv_path = os.path.join(os.getcwd(), f"{team_name}_benchmark.csv")
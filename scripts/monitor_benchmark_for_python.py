@@ -5,12 +5,11 @@ import threading
 import platform
 from datetime import datetime
 import traceback
-import csv
-from collections import defaultdict
 import sys
-import subprocess
-import re
-import shutil
+from _monitor_common import (
+    GpuSampler, MetricAccumulator, get_freq_ratio, prime_cpu_percent,
+    sample_cpu, save_results, sleep_until_next_tick
+)
 
 WEIGHTS = {
     "cpu": 0.1,
@@ -23,113 +22,80 @@ WEIGHTS = {
     "gpu_temp": 0.1
 }
 
-def get_cpu_usage():
-    return psutil.cpu_percent(interval=1)
+def get_all_pids():
+    # Listing /proc is a single readdir; no per-process stat/statm reads
+    if os.path.isdir('/proc'):
+        return {int(n) for n in os.listdir('/proc') if n.isdigit()}
+    return set(psutil.pids())
 
-def get_core_imbalance():
-    per_core = psutil.cpu_percent(interval=1, percpu=True)
-    return max(per_core) - min(per_core) if per_core else 0.0
-
-def get_freq_ratio():
+def is_python_process(pid):
     try:
-        freq = psutil.cpu_freq()
-        return round(freq.current / freq.max, 2) if freq and freq.max else 0
-    except:
-        return 0
-
-def get_all_python_processes():
-    return [p for p in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_info']) if 'python' in (p.info['name'] or '').lower()]
-
-def get_gpu_metrics():
-    possible_paths = ["nvidia-smi", "/usr/bin/nvidia-smi", "/usr/local/bin/nvidia-smi"]
-    nvidia_smi_path = None
-
-    for path in possible_paths:
-        if shutil.which(path):
-            nvidia_smi_path = shutil.which(path)
-            break
-
-    if not nvidia_smi_path:
-        print("[GPU METRIC ERROR] 'nvidia-smi' not found in PATH or common locations.")
-        return 0.0, 0.0, 0.0
+        with open(f'/proc/{pid}/comm') as f:
+            name = f.read().strip()
+    except OSError:
+        try:
+            name = psutil.Process(pid).name()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+    return 'python' in name.lower()
 
+def get_allowed_cpus(pid):
+    # CPUs the process may run on (taskset/cpuset); None where the OS can't say
     try:
-        result = subprocess.check_output(
-            [nvidia_smi_path, "--query-gpu=utilization.gpu,memory.used,memory.total,temperature.gpu",
-             "--format=csv,noheader,nounits"],
-            encoding='utf-8'
-        ).strip()
-
-        lines = result.splitlines()
-        if not lines:
-            return 0.0, 0.0, 0.0
-
-        total_util = 0.0
-        total_mem = 0.0
-        total_temp = 0.0
-
-        for line in lines:
-            parts = re.split(r',\s*', line)
-            if len(parts) != 4:
-                continue
-
-            util = float(parts[0])
-            mem_used = float(parts[1])
-            mem_total = float(parts[2])
-            temp = float(parts[3])
-
-            total_util += util
-            total_mem += (mem_used / mem_total) * 100
-            total_temp += temp
-
-        gpu_count = len(lines)
-        return (
-            total_util / gpu_count,
-            total_mem / gpu_count,
-            total_temp / gpu_count
-        )
-
-    except Exception as e:
-        print(f"[GPU METRIC ERROR] {e}")
-        return 0.0, 0.0, 0.0
-
-def log_metrics(monitored_pids, team_name, csv_path):
+        return frozenset(os.sched_getaffinity(pid))
+    except (AttributeError, OSError):
+        return None
+
+def log_metrics(monitored_pids, procs, team_name, csv_path):
     total_ram = psutil.virtual_memory().total / (1024 ** 2)  # MB
     core_count = psutil.cpu_count(logical=True)
-    stats = defaultdict(list)
+    metrics = MetricAccumulator(WEIGHTS)
+    gpu = GpuSampler()
+    affinity = {}  # pid -> allowed CPUs; affinity rarely changes, so look it up once
     start_time = time.time()
+    prime_cpu_percent()
+    next_tick = time.monotonic()
 
     while monitored_pids:
         try:
-            cpu = get_cpu_usage()
-            core_imbalance = get_core_imbalance()
+            cpu, core_imbalance = sample_cpu()
             freq_ratio = get_freq_ratio()
 
             total_proc_cpu = 0.0
             total_proc_mem = 0.0
+            allowed_cpus = set()
 
             for pid in list(monitored_pids):
                 try:
-                    p = psutil.Process(pid)
-                    total_proc_cpu += p.cpu_percent(interval=0.1)
-                    total_proc_mem += p.memory_info().rss / (1024 ** 2)
+                    p = procs.get(pid)
+                    if p is None:
+                        p = procs[pid] = psutil.Process(pid)
+                        p.cpu_percent(interval=None)  # first call only primes the counter
+                    with p.oneshot():
+                        total_proc_cpu += p.cpu_percent(interval=None)
+                        total_proc_mem += p.memory_info().rss / (1024 ** 2)
+                    if pid not in affinity:
+                        affinity[pid] = get_allowed_cpus(pid)
+                    if allowed_cpus is not None:
+                        allowed_cpus = None if affinity[pid] is None else allowed_cpus | affinity[pid]
                 except (psutil.NoSuchProcess, psutil.AccessDenied):
                     monitored_pids.discard(pid)
+                    procs.pop(pid, None)
+                    affinity.pop(pid, None)
 
-            norm_cpu = (total_proc_cpu / (core_count * 100)) * 100
+            # Normalise against the CPUs the scripts can actually use, not every core on the host
+            cpu_slots = len(allowed_cpus) if allowed_cpus else core_count
+            norm_cpu = (total_proc_cpu / (cpu_slots * 100)) * 100
             norm_ram = (total_proc_mem / total_ram) * 100
-            gpu_util, gpu_mem, gpu_temp = get_gpu_metrics()
+            gpu_util, gpu_mem, gpu_temp = gpu.sample()
 
-            stats["cpu"].append(cpu)
-            stats["core_imbalance"].append(core_imbalance)
-            stats["freq_ratio"].append(freq_ratio)
-            stats["python_cpu"].append(norm_cpu)
-            stats["python_ram"].append(norm_ram)
-            stats["gpu_util"].append(gpu_util)
-            stats["gpu_mem"].append(gpu_mem)
-            stats["gpu_temp"].append(gpu_temp)
+            metrics.add(
+                cpu=cpu, core_imbalance=core_imbalance, freq_ratio=freq_ratio,
+                python_cpu=norm_cpu, python_ram=norm_ram,
+                gpu_util=gpu_util, gpu_mem=gpu_mem, gpu_temp=gpu_temp
+            )
 
-            time.sleep(1)
+            next_tick = sleep_until_next_tick(next_tick)
 
         except Exception as e:
             print("[Error]", e)
@@ -142,24 +108,18 @@ def log_metrics(monitored_pids, team_name, csv_path):
         print(f"\nScripts ran for less than 60 seconds ({int(duration)}s). Skipping CSV generation.")
         return
 
-    def avg(key): return sum(stats[key]) / len(stats[key]) if stats[key] else 0
-    averages = {key: round(avg(key), 2) for key in WEIGHTS}
-    final_score = round(sum(WEIGHTS[k] * averages[k] for k in WEIGHTS), 2)
-    averages["final_score"] = final_score
-
-    print(f"\nFinal Score for {team_name}: {final_score:.2f}")
-
-    with open(csv_path, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=list(averages.keys()))
-        writer.writeheader()
-        writer.writerow(averages)
+    if not metrics.samples:
+        print("\nNo samples were collected. Skipping CSV generation.")
+        return
 
-    print(f"\nResults saved to: {os.path.abspath(csv_path)}")
+    save_results(metrics.averages(), WEIGHTS, team_name, csv_path)
 
 def detect_and_monitor(team_name):
     start_time = time.time()
-    initial_pids = {p.pid for p in get_all_python_processes()}
+    initial_pids = get_all_pids()
     monitored_pids = set()
+    rejected_pids = set()  # live pids already classified as not ours; pruned as they exit
+    procs = {}  # pid -> psutil.Process, primed for non-blocking cpu_percent()
     running = False
     t = None
 
@@ -167,19 +127,28 @@ def detect_and_monitor(team_name):
     print(f"\n🔍 Waiting for new Python scripts to launch for team: {team_name}...")
 
     try:
+        next_tick = time.monotonic()
         while True:
-            current_procs = get_all_python_processes()
-            new_procs = [p for p in current_procs if p.pid not in initial_pids | monitored_pids]
+            current_pids = get_all_pids()
+            rejected_pids &= current_pids  # forget exited pids so the set tracks the live process table
+            new_pids = current_pids - initial_pids - monitored_pids - rejected_pids
 
             valid_new_pids = set()
-            for p in new_procs:
+            for pid in new_pids:
+                if not is_python_process(pid):
+                    rejected_pids.add(pid)
+                    continue
                 try:
-                    proc = psutil.Process(p.pid)
-                    if proc.create_time() > start_time:
-                        if not any(ignore in proc.name().lower() for ignore in ['jupyter', 'pydev', 'spyder', 'conda']):
-                            valid_new_pids.add(p.pid)
+                    proc = psutil.Process(pid)
+                    name = proc.name().lower()
+                    if proc.create_time() > start_time and not any(ignore in name for ignore in ['jupyter', 'pydev', 'spyder', 'conda']):
+                        proc.cpu_percent(interval=None)  # first call only primes the counter
+                        procs[pid] = proc
+                        valid_new_pids.add(pid)
+                    else:
+                        rejected_pids.add(pid)
                 except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
+                    rejected_pids.add(pid)
 
             if valid_new_pids:
                 monitored_pids.update(valid_new_pids)
@@ -187,7 +156,7 @@ def detect_and_monitor(team_name):
                 if not running:
                     running = True
                     print("Starting monitoring...\n(Will stop when all new Python processes exit)")
-                    t = threading.Thread(target=log_metrics, args=(monitored_pids, team_name, csv_path))
+                    t = threading.Thread(target=log_metrics, args=(monitored_pids, procs, team_name, csv_path))
                     t.start()
 
             if running:
@@ -198,7 +167,7 @@ def detect_and_monitor(team_name):
                     t.join()
                     break
 
-            time.sleep(1)
+            next_tick = sleep_until_next_tick(next_tick)
 
     except KeyboardInterrupt:
         print("\nManual interrupt. Saving benchmark results...")
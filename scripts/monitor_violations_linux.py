@@ -4,11 +4,14 @@ import csv
 import os
 import math
 import sys
-from collections import defaultdict
 from datetime import datetime
+from _violation_common import (
+    JunctionTracker, LaneCounters, RedLightCounters, TrafficLightGeometry, wait_for_new_vehicle
+)
 
 # --- Configuration Constants ---
 ZONE_RADIUS = 2.0
+ZONE_RADIUS_SQ = ZONE_RADIUS ** 2
 
 def find_violation_detection_folder():
     """
@@ -20,30 +23,30 @@ def find_violation_detection_folder():
 
 VIOLATION_DIR = find_violation_detection_folder()
 
-def update_master_csv(team_name, lane, collision, redlight):
-    master_path = os.path.join(VIOLATION_DIR, "master_violation.csv")
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-    fieldnames = [
-        "team name", "date/time",
-        "current_lane", "lowest_lane",
-        "current_collision", "lowest_collision",
-        "current_redlight", "lowest_redlight",
-        "current_total", "lowest_total"
-    ]
-
-    rows = []
-    if os.path.exists(master_path):
-        with open(master_path, "r", newline="") as f:
+MASTER_PATH = os.path.join(VIOLATION_DIR, "master_violation.csv")
+MASTER_FIELDNAMES = [
+    "team name", "date/time",
+    "current_lane", "lowest_lane",
+    "current_collision", "lowest_collision",
+    "current_redlight", "lowest_redlight",
+    "current_total", "lowest_total"
+]
+
+def load_master_csv():
+    """Return the master rows in file order (empty if missing or on a header mismatch)."""
+    if os.path.exists(MASTER_PATH):
+        with open(MASTER_PATH, "r", newline="") as f:
             reader = csv.DictReader(f)
-            if set(reader.fieldnames or []) == set(fieldnames):
-                rows = list(reader)
+            if set(reader.fieldnames or []) == set(MASTER_FIELDNAMES):
+                return list(reader)
+    return []
 
-    updated = False
+def update_master_csv(rows, team_name, lane, collision, redlight):
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     current_total = lane + collision + redlight
+
     for row in rows:
         if row["team name"].strip().lower() == team_name.lower():
-            updated = True
             row.update({
                 "date/time": now,
                 "current_lane": str(lane),
@@ -55,24 +58,24 @@ def update_master_csv(team_name, lane, collision, redlight):
             })
             row["current_total"] = str(current_total)
             row["lowest_total"] = str(min(int(row["lowest_total"]), current_total))
-            break
-
-    if not updated:
-        rows.append({
-            "team name": team_name,
-            "date/time": now,
-            "current_lane": str(lane),
-            "lowest_lane": str(lane),
-            "current_collision": str(collision),
-            "lowest_collision": str(collision),
-            "current_redlight": str(redlight),
-            "lowest_redlight": str(redlight),
-            "current_total": str(current_total),
-            "lowest_total": str(current_total)
-        })
-
-    with open(master_path, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+            return
+
+    rows.append({
+        "team name": team_name,
+        "date/time": now,
+        "current_lane": str(lane),
+        "lowest_lane": str(lane),
+        "current_collision": str(collision),
+        "lowest_collision": str(collision),
+        "current_redlight": str(redlight),
+        "lowest_redlight": str(redlight),
+        "current_total": str(current_total),
+        "lowest_total": str(current_total)
+    })
+
+def write_master_csv(rows):
+    with open(MASTER_PATH, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=MASTER_FIELDNAMES)
         writer.writeheader()
         writer.writerows(rows)
 
@@ -81,7 +84,7 @@ class CollisionMonitor:
         self.vehicle = vehicle
         self.world = world
         self.sensor = None
-        self.zones = []
+        self.zones = []  # (x, y) zone centres
         self.static_count = 0
         self.dynamic_count = 0
 
@@ -94,7 +97,8 @@ class CollisionMonitor:
     def _on_collision(self, event):
         loc = self.vehicle.get_location()
         self._cleanup_zones(loc)
-        if any(math.hypot(loc.x - z.x, loc.y - z.y) < ZONE_RADIUS for z in self.zones):
+        x, y = loc.x, loc.y
+        if any((x - zx) * (x - zx) + (y - zy) * (y - zy) < ZONE_RADIUS_SQ for zx, zy in self.zones):
             return
         other = event.other_actor
         if "vehicle" in other.type_id:
@@ -103,10 +107,11 @@ class CollisionMonitor:
         else:
             self.static_count += 1
             print(f"💥 Static collision with {other.type_id}")
-        self.zones.append(loc)
+        self.zones.append((loc.x, loc.y))
 
     def _cleanup_zones(self, current_loc):
-        self.zones = [z for z in self.zones if math.hypot(current_loc.x - z.x, current_loc.y - z.y) < ZONE_RADIUS]
+        x, y = current_loc.x, current_loc.y
+        self.zones = [(zx, zy) for zx, zy in self.zones if (x - zx) * (x - zx) + (y - zy) * (y - zy) < ZONE_RADIUS_SQ]
 
     def destroy(self):
         if self.sensor:
@@ -119,7 +124,8 @@ class LaneMonitor:
         self.world = world
         self.sensor = None
         self.last_turn_time = 0
-        self.violations = defaultdict(int)
+        self.junctions = JunctionTracker(world.get_map())
+        self.violations = LaneCounters()
 
     def attach_sensor(self):
         bp = self.world.get_blueprint_library().find("sensor.other.lane_invasion")
@@ -133,19 +139,17 @@ class LaneMonitor:
         if now - self.last_turn_time < 5.0:
             return
         if carla.LaneMarkingType.SolidSolid in markings:
-            self.violations["illegal_double_solid_cross"] += 1
+            self.violations.double_solid += 1
             print("ILLEGAL: Crossed DOUBLE SOLID line!")
         elif carla.LaneMarkingType.Solid in markings:
-            self.violations["illegal_solid_cross"] += 1
+            self.violations.solid += 1
             print("ILLEGAL: Crossed SOLID line!")
         elif carla.LaneMarkingType.Broken in markings:
-            self.violations["unjustified_dashed_cross"] += 1
+            self.violations.dashed += 1
             print("UNJUSTIFIED: Crossed dashed line!")
 
     def update_turn_status(self):
-        loc = self.vehicle.get_transform().location
-        wp = self.world.get_map().get_waypoint(loc)
-        if wp.is_junction:
+        if self.junctions.in_junction(self.vehicle.get_transform().location):
             self.last_turn_time = time.time()
 
     def destroy(self):
@@ -157,29 +161,13 @@ class RedLightMonitor:
     def __init__(self, vehicle):
         self.vehicle = vehicle
         self.violation_logged = False
-        self.violations = defaultdict(int)
+        self.violations = RedLightCounters()
+        self.lights = TrafficLightGeometry()
 
     def get_speed(self):
         v = self.vehicle.get_velocity()
         return math.sqrt(v.x**2 + v.y**2 + v.z**2)
 
-    def get_stop_data(self, tl):
-        wps = tl.get_stop_waypoints()
-        if wps:
-            wp = wps[0]
-            return wp.transform.location, wp.transform.rotation.get_forward_vector()
-        return None, None
-
-    def is_inside_trigger_box(self, tl):
-        trg = tl.trigger_volume
-        world_loc = tl.get_transform().transform(trg.location)
-        veh_loc = self.vehicle.get_location()
-        return (
-            abs(world_loc.x - veh_loc.x) <= trg.extent.x and
-            abs(world_loc.y - veh_loc.y) <= trg.extent.y and
-            abs(world_loc.z - veh_loc.z) <= trg.extent.z
-        )
-
     def tick(self):
         tl = self.vehicle.get_traffic_light()
         if tl is None or tl.get_state() != carla.TrafficLightState.Red:
@@ -188,21 +176,25 @@ class RedLightMonitor:
 
         speed = self.get_speed()
         veh_loc = self.vehicle.get_location()
-        stop_loc, stop_fwd = self.get_stop_data(tl)
+        stop_loc, stop_fwd = self.lights.stop_data(tl)
 
         violation = None
         distance = 0.0
         if stop_loc:
+            fx, fy, fz = stop_fwd
             rel = veh_loc - stop_loc
-            dot = rel.x*stop_fwd.x + rel.y*stop_fwd.y + rel.z*stop_fwd.z
+            dot = rel.x*fx + rel.y*fy + rel.z*fz
             if dot > 0 and speed > 1.0:
                 violation, distance = "StopWaypointPassed", dot
-        elif self.is_inside_trigger_box(tl) and speed > 1.0:
+                if not self.violation_logged:
+                    self.violations.stop_waypoint += 1
+        elif self.lights.inside_trigger(tl, veh_loc) and speed > 1.0:
             violation = "TriggerVolume"
-            distance = veh_loc.distance(tl.get_transform().location)
+            distance = veh_loc.distance(self.lights.location(tl))
+            if not self.violation_logged:
+                self.violations.trigger_volume += 1
 
         if violation and not self.violation_logged:
-            self.violations[violation] += 1
             print(f"🚦 RED LIGHT VIOLATION: {violation} | Distance: {distance:.2f}")
             self.violation_logged = True
         elif not violation:
@@ -236,13 +228,8 @@ class TeamMonitor:
     def find_vehicle(self):
         existing = {v.id for v in self.world.get_actors().filter("vehicle.*")}
         print("⏳ Waiting for ego vehicle...")
-        while not self.vehicle:
-            for v in self.world.get_actors().filter("vehicle.*"):
-                if v.id not in existing:
-                    self.vehicle = v
-                    print(f"🚗 Detected ego: {v.type_id} (ID {v.id})")
-                    return
-            time.sleep(0.5)
+        self.vehicle = wait_for_new_vehicle(self.world, existing)
+        print(f"🚗 Detected ego: {self.vehicle.type_id} (ID {self.vehicle.id})")
 
     def run(self):
         self.find_vehicle()
@@ -258,7 +245,7 @@ class TeamMonitor:
                 self.lane.update_turn_status()
                 self.redlight.tick()
                 self.collision._cleanup_zones(self.vehicle.get_location())
-                if self.vehicle.id not in {v.id for v in self.world.get_actors().filter("vehicle.*")}:
+                if not self.vehicle.is_alive:
                     break
                 time.sleep(0.1)
         except KeyboardInterrupt:
@@ -267,15 +254,15 @@ class TeamMonitor:
             self.cleanup()
 
     def cleanup(self):
-        ds = self.lane.violations["illegal_double_solid_cross"]
-        s = self.lane.violations["illegal_solid_cross"]
-        d = self.lane.violations["unjustified_dashed_cross"]
+        ds = self.lane.violations.double_solid
+        s = self.lane.violations.solid
+        d = self.lane.violations.dashed
         total_lane = ds + s + d
         static = self.collision.static_count
         dynamic = self.collision.dynamic_count
         total_coll = static + dynamic
-        stop_v = self.redlight.violations["StopWaypointPassed"]
-        trig_v = self.redlight.violations["TriggerVolume"]
+        stop_v = self.redlight.violations.stop_waypoint
+        trig_v = self.redlight.violations.trigger_volume
         total_red = stop_v + trig_v
 
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -283,7 +270,10 @@ class TeamMonitor:
             w = csv.writer(f)
             w.writerow([ds, s, d, total_lane, static, dynamic, total_coll, stop_v, trig_v, total_red, ts])
 
-        update_master_csv(self.team_name, total_lane, total_coll, total_red)
+        # Read, update and rewrite the master sheet in one pass at shutdown
+        master = load_master_csv()
+        update_master_csv(master, self.team_name, total_lane, total_coll, total_red)
+        write_master_csv(master)
 
         self.lane.destroy()
         self.collision.destroy()
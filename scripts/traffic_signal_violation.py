@@ -5,63 +5,7 @@ import os
 import math
 from datetime import datetime
 
-# 1. CONNECT TO CARLA 
-client = carla.Client("localhost", 2000)
-client.set_timeout(10.0)
-world = client.get_world() 
-
-# 2. WAIT AND FIND THE VEHICLE TO MONITOR
-print("Waiting up to 60 seconds for a vehicle to spawn...")
-
-vehicle = None
-start_time = time.time()
-timeout_seconds = 60
-
-while time.time() - start_time < timeout_seconds:
-    for actor in world.get_actors().filter("vehicle.*"):
-        if actor.attributes.get("role_name", "") == "hero":
-            vehicle = actor
-            break
-    if vehicle is not None:
-        break
-    time.sleep(1)  # check every second
-
-if vehicle is None:
-    # If no 'hero' vehicle is found, fall back to any vehicle
-    print("No vehicle with role_name='hero' found. Waiting for any vehicle...")
-    start_time = time.time()
-    while time.time() - start_time < timeout_seconds:
-        vehicles = world.get_actors().filter("vehicle.*")
-        if vehicles:
-            vehicle = vehicles[0]
-            break
-        time.sleep(1)
-
-if vehicle is None:
-    raise RuntimeError("No vehicle found after 60 seconds. Please start a simulation.")
-
-print(f"Monitoring vehicle ID={vehicle.id} ({vehicle.type_id})")
-
-
-# 3. CSV LOGGING SETUP
-script_dir = os.path.dirname(os.path.abspath(__file__))  # directory of test_violation.py
-output_dir = os.path.join(script_dir, "..", "output")    # go up one level and into 'output'
-output_dir = os.path.abspath(output_dir)                 # normalize path
-
-os.makedirs(output_dir, exist_ok=True)
-
-csv_filename = os.path.join(output_dir, "violations.csv")
-
-if not os.path.exists(csv_filename):
-    with open(csv_filename, mode="w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            "Timestamp", "VehicleID", "Speed_mps",
-            "Location_x", "Location_y", "Location_z",
-            "TrafficLightState", "ViolationType", "DistancePastStop"
-        ])
-
-# 4. UTILITY FUNCTIONS
+# 1. UTILITY FUNCTIONS
 def get_speed(veh):
     # Return speed (m/s) of vehicle.
     v = veh.get_velocity()
@@ -90,60 +34,116 @@ def is_inside_trigger_box(veh, traffic_light):
     dz = abs(world_trigger_loc.z - veh_loc.z)
     return (dx <= trigger.extent.x and dy <= trigger.extent.y and dz <= trigger.extent.z)
 
-# 5. MAIN MONITOR LOOP
-violation_logged = False
-
-try:
-    while True:
-        # 5.1. Find the traffic light (if any) that affects this vehicle
-        tl = vehicle.get_traffic_light()
-
-        if tl is not None:
-            state = tl.get_state()
-            veh_loc = vehicle.get_location()
-            speed = get_speed(vehicle)
-
-            # 5.2. Attempt to get the stop waypoint location & direction
-            stop_loc, stop_fwd = get_stop_data(tl)
-
-            violation_detected = False
-            violation_type = None
-            distance_past = None
-
-            if state == carla.TrafficLightState.Red:
-                if stop_loc is not None:
-                    # Compute vector from stop line to vehicle, then project onto lane forward
-                    rel_x = veh_loc.x - stop_loc.x
-                    rel_y = veh_loc.y - stop_loc.y
-                    rel_z = veh_loc.z - stop_loc.z
-                    # Dot product with forward vector: if positive, vehicle is "past" the stop line
-                    dot = rel_x * stop_fwd.x + rel_y * stop_fwd.y + rel_z * stop_fwd.z
-
-                    # If dot > 0, we've crossed the stop line in the direction of travel
-                    if dot > 0 and speed > 1.0:
-                        violation_detected = True
-                        violation_type = "StopWaypointPassed"
-                        distance_past = dot  # how far "beyond" the stop line
-
-                else:
-                    # No stop waypoint available: fall back to trigger-volume check
-                    inside_trigger = is_inside_trigger_box(vehicle, tl)
-                    if inside_trigger and speed > 1.0:
-                        violation_detected = True
-                        violation_type = "TriggerVolume"
-                        # We can record distance to TL center as a rough proxy
-                        distance_past = veh_loc.distance(tl.get_transform().location)
-
-            # 5.3. Log if first time this red-state violation is seen
-            if violation_detected and not violation_logged:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print(f"Red light violation at {timestamp} | "
-                      f"Vehicle ID={vehicle.id}, Speed={speed:.2f} m/s, "
-                      f"Type={violation_type}, DistancePast={distance_past:.2f}")
-
-                # Write a row to CSV
-                with open(csv_filename, mode="a", newline="") as f:
-                    writer = csv.writer(f)
+def main():
+    # 2. CONNECT TO CARLA 
+    client = carla.Client("localhost", 2000)
+    client.set_timeout(10.0)
+    world = client.get_world() 
+
+    # 3. WAIT AND FIND THE VEHICLE TO MONITOR
+    print("Waiting up to 60 seconds for a vehicle to spawn...")
+
+    vehicle = None
+    start_time = time.time()
+    timeout_seconds = 60
+
+    while time.time() - start_time < timeout_seconds:
+        for actor in world.get_actors().filter("vehicle.*"):
+            if actor.attributes.get("role_name", "") == "hero":
+                vehicle = actor
+                break
+        if vehicle is not None:
+            break
+        time.sleep(1)  # check every second
+
+    if vehicle is None:
+        # If no 'hero' vehicle is found, fall back to any vehicle
+        print("No vehicle with role_name='hero' found. Waiting for any vehicle...")
+        start_time = time.time()
+        while time.time() - start_time < timeout_seconds:
+            vehicles = world.get_actors().filter("vehicle.*")
+            if vehicles:
+                vehicle = vehicles[0]
+                break
+            time.sleep(1)
+
+    if vehicle is None:
+        raise RuntimeError("No vehicle found after 60 seconds. Please start a simulation.")
+
+    print(f"Monitoring vehicle ID={vehicle.id} ({vehicle.type_id})")
+
+
+    # 4. CSV LOGGING SETUP
+    script_dir = os.path.dirname(os.path.abspath(__file__))  # directory of test_violation.py
+    output_dir = os.path.join(script_dir, "..", "output")    # go up one level and into 'output'
+    output_dir = os.path.abspath(output_dir)                 # normalize path
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    csv_filename = os.path.join(output_dir, "violations.csv")
+
+    # One buffered handle for the whole run; flushed on exit
+    csv_file = open(csv_filename, mode="a", newline="", buffering=8192)
+    writer = csv.writer(csv_file)
+    if csv_file.tell() == 0:
+        writer.writerow([
+            "Timestamp", "VehicleID", "Speed_mps",
+            "Location_x", "Location_y", "Location_z",
+            "TrafficLightState", "ViolationType", "DistancePastStop"
+        ])
+
+    # 5. MAIN MONITOR LOOP
+    violation_logged = False
+
+    try:
+        while True:
+            # 5.1. Find the traffic light (if any) that affects this vehicle
+            tl = vehicle.get_traffic_light()
+
+            if tl is not None:
+                state = tl.get_state()
+                veh_loc = vehicle.get_location()
+                speed = get_speed(vehicle)
+
+                # 5.2. Attempt to get the stop waypoint location & direction
+                stop_loc, stop_fwd = get_stop_data(tl)
+
+                violation_detected = False
+                violation_type = None
+                distance_past = None
+
+                if state == carla.TrafficLightState.Red:
+                    if stop_loc is not None:
+                        # Compute vector from stop line to vehicle, then project onto lane forward
+                        rel_x = veh_loc.x - stop_loc.x
+                        rel_y = veh_loc.y - stop_loc.y
+                        rel_z = veh_loc.z - stop_loc.z
+                        # Dot product with forward vector: if positive, vehicle is "past" the stop line
+                        dot = rel_x * stop_fwd.x + rel_y * stop_fwd.y + rel_z * stop_fwd.z
+
+                        # If dot > 0, we've crossed the stop line in the direction of travel
+                        if dot > 0 and speed > 1.0:
+                            violation_detected = True
+                            violation_type = "StopWaypointPassed"
+                            distance_past = dot  # how far "beyond" the stop line
+
+                    else:
+                        # No stop waypoint available: fall back to trigger-volume check
+                        inside_trigger = is_inside_trigger_box(vehicle, tl)
+                        if inside_trigger and speed > 1.0:
+                            violation_detected = True
+                            violation_type = "TriggerVolume"
+                            # We can record distance to TL center as a rough proxy
+                            distance_past = veh_loc.distance(tl.get_transform().location)
+
+                # 5.3. Log if first time this red-state violation is seen
+                if violation_detected and not violation_logged:
+                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    print(f"Red light violation at {timestamp} | "
+                          f"Vehicle ID={vehicle.id}, Speed={speed:.2f} m/s, "
+                          f"Type={violation_type}, DistancePast={distance_past:.2f}")
+
+                    # Write a row to CSV
                     writer.writerow([
                         timestamp,
                         vehicle.id,
@@ -155,24 +155,29 @@ try:
                         violation_type,
                         f"{distance_past:.2f}"
                     ])
-                violation_logged = True
-
-            elif not violation_detected:
-                # Reset flag once the vehicle either slows down, goes back before stop line,
-                # or the light turns green
+                    violation_logged = True
+
+                elif not violation_detected:
+                    # Reset flag once the vehicle either slows down, goes back before stop line,
+                    # or the light turns green
+                    violation_logged = False
+            else:
+                # Vehicle not currently influenced by any TL
                 violation_logged = False
-        else:
-            # Vehicle not currently influenced by any TL
-            violation_logged = False
 
-        # 5.4. Small delay -> 10 Hz polling
-        time.sleep(0.1)
+            # 5.4. Small delay -> 10 Hz polling
+            time.sleep(0.1)
+
+    except KeyboardInterrupt:
+        print("\nMonitoring stopped by user (Ctrl+C).")
+
+    except Exception as e:
+        print(f"\nException occurred: {e}")
 
-except KeyboardInterrupt:
-    print("\nMonitoring stopped by user (Ctrl+C).")
+    finally:
+        csv_file.close()
+        print("Exiting async red-light violation monitor.")
 
-except Exception as e:
-    print(f"\nException occurred: {e}")
 
-finally:
-    print("Exiting async red-light violation monitor.")
+if __name__ == "__main__":
+    main()